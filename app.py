@@ -1,17 +1,26 @@
 import streamlit as st
 import google.generativeai as genai
-from googleapiclient.discovery import build
+import google.ai.generativelanguage as glm
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport import requests
-from httplib2 import Http
-from oauth2client import file, client, tools
-from educhain import Educhain, LLMConfig
-from educhain.engines import qna_engine
-from langchain_google_genai import ChatGoogleGenerativeAI  # Still need this for Educhain LLMConfig
-import os
+from google.auth.transport.requests import Request
+# googleapiclient, httplib2, google_auth_oauthlib, educhain and langchain_google_genai
+# are imported lazily inside the functions that need them: together they dominate
+# cold-start import time, and many sessions never authenticate or generate a form.
+import asyncio
+import functools
+import hashlib
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import json
-import tempfile
+import string
+import time
+from collections import deque
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
 from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
 
 # --- Configuration ---
@@ -19,18 +28,21 @@ SCOPES = [
     'https://www.googleapis.com/auth/forms.body',
 ]
 FORM_TITLE = "QUIZ"
+MAX_HISTORY = 50  # Messages kept in session state; history is re-rendered on every rerun
 
 # --- Accessing Secrets ---
-secrets_data = st.secrets["google"]  # Access all Google secrets
+# Materialized into a plain dict once at import; st.secrets walks its TOML-backed
+# mapping on every access, and nothing after this line should pay that again.
+_WEB_SECRETS = dict(st.secrets["google"]["web"])
 
-CLIENT_ID = secrets_data["web"]["client_id"] #Changed
-CLIENT_SECRET = secrets_data["web"]["client_secret"] #Changed
-PROJECT_ID = secrets_data["web"]["project_id"] #Changed
-AUTH_URI = secrets_data["web"]["auth_uri"] #Changed
-TOKEN_URI = secrets_data["web"]["token_uri"] #Changed
-AUTH_PROVIDER_X509_CERT_URL = secrets_data["web"]["auth_provider_x509_cert_url"] #Changed
-REDIRECT_URIS = secrets_data["web"]["redirect_uris"] #Changed
-JAVASCRIPT_ORIGINS = secrets_data["web"]["javascript_origins"] #changed
+CLIENT_ID = _WEB_SECRETS["client_id"] #Changed
+CLIENT_SECRET = _WEB_SECRETS["client_secret"] #Changed
+TOKEN_URI = _WEB_SECRETS["token_uri"] #Changed
+REDIRECT_URIS = _WEB_SECRETS["redirect_uris"] #Changed
+
+# Flow.from_client_config takes this dict directly, so no client-secrets
+# file ever touches disk.
+CLIENT_CONFIG = {"web": _WEB_SECRETS}
 
 
 # --- Function Schemas (using Python Dictionaries) ---
@@ -38,7 +50,9 @@ topic_schema = {'type': 'STRING', 'description': 'The topic for generating quest
 num_questions_schema = {'type': 'INTEGER', 'description': 'The number of questions to generate.'}
 custom_instructions_schema = {'type': 'STRING', 'description': 'Optional instructions for question generation.'}
 
-mcq_params_schema = {
+# The four plain question tools take byte-identical parameters, so they share a single
+# schema object instead of carrying four copies in every tools payload.
+COMMON_PARAMS_SCHEMA = {
     'type': 'OBJECT',
     'properties': {
         'topic': topic_schema,
@@ -48,34 +62,19 @@ mcq_params_schema = {
     'required': ['topic', 'num_questions']
 }
 
-short_answer_params_schema = {
+generate_mixed_params_schema = {
     'type': 'OBJECT',
     'properties': {
         'topic': topic_schema,
         'num_questions': num_questions_schema,
+        'question_types': {
+            'type': 'ARRAY',
+            'items': {'type': 'STRING', 'enum': ['Multiple Choice', 'Short Answer', 'True/False', 'Fill in the Blank']},
+            'description': 'The question types to generate, one set per type.'
+        },
         'custom_instructions': custom_instructions_schema,
     },
-    'required': ['topic', 'num_questions']
-}
-
-true_false_params_schema = {
-    'type': 'OBJECT',
-    'properties': {
-        'topic': topic_schema,
-        'num_questions': num_questions_schema,
-        'custom_instructions': custom_instructions_schema,
-    },
-    'required': ['topic', 'num_questions']
-}
-
-fill_blank_params_schema = {
-    'type': 'OBJECT',
-    'properties': {
-        'topic': topic_schema,
-        'num_questions': num_questions_schema,
-        'custom_instructions': custom_instructions_schema,
-    },
-    'required': ['topic', 'num_questions']
+    'required': ['topic', 'num_questions', 'question_types']
 }
 
 generate_form_params_schema = {
@@ -92,24 +91,21 @@ generate_form_params_schema = {
 # Define FunctionDeclarations using dictionaries directly
 function_declarations = [
     {
-        'name': 'generate_mcq',
-        'description': 'Generate multiple choice questions on a given topic.',
-        'parameters': mcq_params_schema,
-    },
-    {
-        'name': 'generate_short_answer',
-        'description': 'Generate short answer questions on a given topic.',
-        'parameters': short_answer_params_schema,
-    },
-    {
-        'name': 'generate_true_false',
-        'description': 'Generate true/false questions on a given topic.',
-        'parameters': true_false_params_schema,
-    },
+        'name': name,
+        'description': description,
+        'parameters': COMMON_PARAMS_SCHEMA,
+    }
+    for name, description in [
+        ('generate_mcq', 'Generate multiple choice questions on a given topic.'),
+        ('generate_short_answer', 'Generate short answer questions on a given topic.'),
+        ('generate_true_false', 'Generate true/false questions on a given topic.'),
+        ('generate_fill_blank', 'Generate fill in the blank questions on a given topic.'),
+    ]
+] + [
     {
-        'name': 'generate_fill_blank',
-        'description': 'Generate fill in the blank questions on a given topic.',
-        'parameters': fill_blank_params_schema,
+        'name': 'generate_mixed',
+        'description': 'Generate several question types on a given topic in one request.',
+        'parameters': generate_mixed_params_schema,
     },
     {
         'name': 'generate_form',  # New Function
@@ -120,47 +116,148 @@ function_declarations = [
 
 tools_config = {'function_declarations': function_declarations}  # Define tools config as dictionary
 
+def _schema_to_proto(schema):
+    """Converts a dict-form parameter schema into a glm.Schema proto."""
+    proto = glm.Schema(type_=getattr(glm.Type, schema['type']))
+    if 'description' in schema:
+        proto.description = schema['description']
+    if 'enum' in schema:
+        proto.enum.extend(schema['enum'])
+    if 'items' in schema:
+        proto.items = _schema_to_proto(schema['items'])
+    for name, sub_schema in schema.get('properties', {}).items():
+        proto.properties[name] = _schema_to_proto(sub_schema)
+    if 'required' in schema:
+        proto.required.extend(schema['required'])
+    return proto
+
+# The declarations never change at runtime, so convert them to a Tool proto once at import
+# instead of letting GenerativeModel re-walk and re-validate the dicts on every instantiation.
+_TOOL_PROTO = glm.Tool(function_declarations=[
+    glm.FunctionDeclaration(
+        name=fd['name'],
+        description=fd['description'],
+        parameters=_schema_to_proto(fd['parameters']),
+    )
+    for fd in function_declarations
+])
+
 
 @st.cache_resource
-def initialize_gemini_model(model_name, tools_config_):  # Renamed to tools_config_ to avoid shadowing
-    """Initializes Gemini model directly with function calling config."""
+def initialize_gemini_model(model_name):
+    """Initializes Gemini model directly with function calling config.
+
+    The tools proto is a module-level constant, so it is referenced directly here
+    rather than passed as an argument — this keeps the cache keyed on model_name only.
+    """
     gemini_model = genai.GenerativeModel(  # Use genai.GenerativeModel
         model_name,
-        tools=[tools_config_],  # Pass tools_config (which is now a dict) within a list
+        tools=[_TOOL_PROTO],  # Pre-built proto, no per-instantiation dict conversion
     )
     return gemini_model
 
-def authenticate_google_api():
-    """Authenticates with Google using OAuth2.
-    Returns the authorization URL if authentication is needed, otherwise None."""
-    creds = st.session_state.get("credentials", None)
-    if creds and not creds.invalid:
-        return None  # Already authenticated
+@st.cache_resource(ttl=3600, show_spinner=False)
+def _build_qna_engine(model_name, api_key_hash, _api_key):
+    """Builds the Educhain client; cached per (model, key hash) with an hourly TTL.
 
+    The raw key only travels through the underscore-prefixed argument, which Streamlit
+    excludes from the cache key, so key material is never retained as cache identity.
+    """
+    from educhain import Educhain, LLMConfig
+    from langchain_google_genai import ChatGoogleGenerativeAI  # Still need this for Educhain LLMConfig
+
+    educhain_client = Educhain(LLMConfig(custom_model=ChatGoogleGenerativeAI(model=model_name, google_api_key=_api_key)))
+    return educhain_client.qna_engine
+
+def get_qna_engine(model_name, api_key):
+    """Returns the cached qna_engine for this model/key, shared across tabs with the same key."""
+    api_key_hash = hashlib.blake2b(api_key.encode(), digest_size=8).hexdigest()
+    engine = _build_qna_engine(model_name, api_key_hash, api_key)
+    # Stable identity for the question cache: the resource cache's TTL can evict an
+    # engine, after which id() of its replacement may collide with the old address.
+    engine._cache_key = (model_name, api_key_hash)
+    return engine
+
+def _get_cookie_manager():
+    """Mounts the encrypted cookie manager for this rerun, or returns None.
+
+    Cookie persistence is best-effort: it needs the optional streamlit-cookies-manager
+    package and a ``cookies.password`` secret. The component has to be remounted on
+    every rerun, so main() calls this once and parks the result in session state.
+    """
     try:
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as tmpfile:
-            json.dump({"web": {
-                    "client_id": CLIENT_ID,
-                    "project_id": PROJECT_ID,
-                    "auth_uri": AUTH_URI,
-                    "token_uri": TOKEN_URI,
-                    "auth_provider_x509_cert_url": AUTH_PROVIDER_X509_CERT_URL,
-                    "client_secret": CLIENT_SECRET,
-                    "redirect_uris": REDIRECT_URIS,
-                    "javascript_origins": JAVASCRIPT_ORIGINS
-                }}, tmpfile)
-            temp_file_path = tmpfile.name  # Get the path to the temp file
+        from streamlit_cookies_manager import EncryptedCookieManager
+    except ImportError:
+        return None
+    try:
+        password = st.secrets["cookies"]["password"]
+    except (KeyError, FileNotFoundError):
+        return None
+    cookies = EncryptedCookieManager(prefix="educhain/", password=password)
+    if not cookies.ready():
+        return None
+    return cookies
 
-        # Pass the temporary file path to flow_from_clientsecrets
-        flow = client.flow_from_clientsecrets(temp_file_path, SCOPES)
+def load_credentials():
+    """Returns the session's credentials, rebuilding them from the stored token if needed.
 
-        # Clean up the temporary file
-        os.remove(temp_file_path)
+    The serialized token (including the refresh token) lives in session state, so an
+    expired access token is refreshed in place instead of rerunning the OAuth dance.
+    A refresh token persisted in the browser cookie lets auth survive a page reload,
+    which otherwise wipes session state and forces the full human-in-the-loop flow.
+    """
+    creds = st.session_state.get("credentials", None)
+    if creds is None:
+        token_json = st.session_state.get("google_token")
+        if token_json:
+            creds = Credentials.from_authorized_user_info(json.loads(token_json))
+            st.session_state["credentials"] = creds
+    if creds is None:
+        cookies = st.session_state.get("_cookies")
+        if cookies is not None:
+            refresh_token = cookies.get("google_refresh_token")
+            if refresh_token:
+                creds = Credentials(
+                    None,
+                    refresh_token=refresh_token,
+                    token_uri=TOKEN_URI,
+                    client_id=CLIENT_ID,
+                    client_secret=CLIENT_SECRET,
+                    scopes=SCOPES,
+                )
+                st.session_state["credentials"] = creds
+    if creds and creds.refresh_token and (creds.expired or not creds.valid):
+        try:
+            creds.refresh(Request())
+            st.session_state["google_token"] = creds.to_json()
+        except Exception as e:
+            st.error(f"Token refresh failed: {e}")
+            return None
+    return creds
+
+def _get_oauth_flow():
+    """Builds a fresh OAuth flow from the in-memory client config.
+
+    Deliberately not cached: authorization_url() and fetch_token() mutate the
+    underlying OAuth2Session, so a process-wide instance could hand one user
+    another's credentials. Construction is cheap — the config dict already lives
+    in memory and the import is only paid on the first call.
+    """
+    from google_auth_oauthlib.flow import Flow
 
-        flow.redirect_uri = REDIRECT_URIS[0]
+    return Flow.from_client_config(CLIENT_CONFIG, scopes=SCOPES, redirect_uri=REDIRECT_URIS[0])
 
-        auth_url = flow.step1_get_authorize_url() # Get the authorization URL
+def authenticate_google_api():
+    """Authenticates with Google using OAuth2.
+    Returns the authorization URL if authentication is needed, otherwise None."""
+    creds = load_credentials()
+    if creds and creds.valid:
+        return None  # Already authenticated
 
+    try:
+        flow = _get_oauth_flow()
+        auth_url, state = flow.authorization_url(access_type='offline', prompt='consent')
+        st.session_state["oauth_state"] = state
         return auth_url
 
     except Exception as e:
@@ -169,26 +266,25 @@ def authenticate_google_api():
 
 def complete_authentication(auth_code):
     """Completes the authentication process and stores credentials in session state."""
+    # CSRF check: the state minted in authenticate_google_api must match the one
+    # Google echoed back. It can only be enforced when the redirect lands in the
+    # session that stored it — a full page reload starts a fresh session.
+    expected_state = st.session_state.get("oauth_state")
+    if expected_state and st.query_params.get("state") != expected_state:
+        st.error("Authentication failed: state mismatch. Please use the login link again.")
+        return None
     try:
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as tmpfile:
-            json.dump({"web": {
-                    "client_id": CLIENT_ID,
-                    "project_id": PROJECT_ID,
-                    "auth_uri": AUTH_URI,
-                    "token_uri": TOKEN_URI,
-                    "auth_provider_x509_cert_url": AUTH_PROVIDER_X509_CERT_URL,
-                    "client_secret": CLIENT_SECRET,
-                    "redirect_uris": REDIRECT_URIS,
-                    "javascript_origins": JAVASCRIPT_ORIGINS
-                }}, tmpfile)
-            temp_file_path = tmpfile.name
-
-        flow = client.flow_from_clientsecrets(temp_file_path, SCOPES)
-        os.remove(temp_file_path)
-        flow.redirect_uri = REDIRECT_URIS[0]  # Must set redirect URI
-
-        creds = flow.step2_exchange(auth_code)
+        flow = _get_oauth_flow()
+        flow.fetch_token(code=auth_code)
+
+        creds = flow.credentials
+        st.session_state.pop("auth_url", None)  # The stored login link is stale now
         st.session_state["credentials"] = creds  # Store in session state
+        st.session_state["google_token"] = creds.to_json()  # Keep the refresh token for later reruns
+        cookies = st.session_state.get("_cookies")
+        if cookies is not None and creds.refresh_token:  # Survive page reloads, not just reruns
+            cookies["google_refresh_token"] = creds.refresh_token
+            cookies.save()
         st.success("Authentication successful!")
         return creds
 
@@ -196,13 +292,114 @@ def complete_authentication(auth_code):
         st.error(f"Error completing authentication: {e}")
         return None
 
+_ORJSON_MODEL_CLS = None
+
+def _orjson_model():
+    """Returns a JsonModel that (de)serializes API bodies with orjson when installed.
+
+    Large quiz payloads (50+ questions with long option strings) are CPU-bound on
+    stdlib json; orjson is 2-3x faster on both directions. Falls back to the stock
+    JsonModel behaviour when orjson is unavailable. The class is built lazily so
+    googleapiclient is only imported once form creation is actually used.
+    """
+    global _ORJSON_MODEL_CLS
+    if _ORJSON_MODEL_CLS is None:
+        from googleapiclient.model import JsonModel
+
+        class OrjsonModel(JsonModel):
+            def serialize(self, body_value):
+                if orjson is None:
+                    return super().serialize(body_value)
+                if isinstance(body_value, dict) and "data" not in body_value and self._data_wrapper:
+                    body_value = {"data": body_value}
+                return orjson.dumps(body_value).decode()
+
+            def deserialize(self, content):
+                if orjson is None:
+                    return super().deserialize(content)
+                body = orjson.loads(content)
+                if self._data_wrapper and isinstance(body, dict) and "data" in body:
+                    body = body["data"]
+                return body
+
+        _ORJSON_MODEL_CLS = OrjsonModel
+    return _ORJSON_MODEL_CLS()
+
+@st.cache_resource
+def get_forms_service(_creds, creds_token):
+    """Builds the Google Forms service once per access token and reuses it for the session.
+
+    static_discovery=True serves the API schema from the bundled discovery document,
+    skipping the HTTPS fetch that build() would otherwise do on every call. The creds
+    object itself is unhashable, so the token string is the cache key.
+
+    The explicit AuthorizedHttp wraps one httplib2.Http for the life of the cached
+    service, so forms.create and every batchUpdate reuse the same keep-alive TLS
+    connection instead of paying a handshake per call.
+    """
+    from googleapiclient.discovery import build
+    from google_auth_httplib2 import AuthorizedHttp
+    from httplib2 import Http
+
+    authorized_http = AuthorizedHttp(_creds, http=Http(timeout=30))
+    return build('forms', 'v1', http=authorized_http, model=_orjson_model(),
+                 cache_discovery=False, static_discovery=True)
+
+# The createItem scaffolding is identical for every question of a given type, so it is
+# built by small helpers instead of re-spelling the nested dict literal per iteration.
+def _choice_item(title, options, index):
+    """Builds a createItem request for a single-selection (RADIO) question."""
+    return {
+        "createItem": {
+            "item": {
+                "title": title,
+                "questionItem": {
+                    "question": {
+                        "choiceQuestion": {
+                            "type": "RADIO",  # For single-selection questions.
+                            "options": [{"value": opt} for opt in options]
+                        }
+                    }
+                }
+            },
+            "location": {"index": index}
+        }
+    }
+
+def _text_item(title, index):
+    """Builds a createItem request for a free-text question."""
+    return {
+        "createItem": {
+            "item": {
+                "title": title,
+                "questionItem": {
+                    "question": {
+                        "textQuestion": {}
+                    }
+                }
+            },
+            "location": {"index": index}
+        }
+    }
+
+# createItem builder per question type, so the request payload is built by one
+# comprehension instead of re-branching on the type string inside the loop.
+_ITEM_BUILDERS = {
+    "Multiple Choice": lambda q, i: _choice_item(q.question, q.options, i),
+    "True/False": lambda q, i: _choice_item(q.question, ("True", "False"), i),
+    "Short Answer": lambda q, i: _text_item(q.question, i),
+    "Fill in the Blank": lambda q, i: _text_item(q.question, i),
+}
+
+_FORMS_BATCH_LIMIT = 100  # Google caps batchUpdate at 100 requests per call
+
 def create_form_with_questions(creds, form_title, questions, question_type):
     """
     Creates a new Google Form with the given title and adds the provided questions.
     Handles different question types.
     """
     try:
-        form_service = build('forms', 'v1', http=creds.authorize(Http()))
+        form_service = get_forms_service(creds, creds.token)
         # Create the form with basic info.
         new_form = {
             'info': {
@@ -213,79 +410,13 @@ def create_form_with_questions(creds, form_title, questions, question_type):
         created_form = form_service.forms().create(body=new_form).execute()
         form_id = created_form.get('formId')
 
-        # Build the batchUpdate request payload.
-        requests = []
-        for i, question_data in enumerate(questions.questions):
-            if question_type == "Multiple Choice":
-                question = {
-                    "createItem": {
-                        "item": {
-                            "title": question_data.question,
-                            "questionItem": {
-                                "question": {
-                                    "choiceQuestion": {
-                                        "type": "RADIO",  # For single-selection questions.
-                                        "options": [{"value": opt} for opt in question_data.options]
-                                    }
-                                }
-                            }
-                        },
-                        "location": {"index": i}
-                    }
-                }
-                requests.append(question)
-            elif question_type == "Short Answer":
-                question = {
-                    "createItem": {
-                        "item": {
-                            "title": question_data.question,
-                            "questionItem": {
-                                "question": {
-                                    "textQuestion": {}
-                                }
-                            }
-                        },
-                        "location": {"index": i}
-                    }
-                }
-                requests.append(question)
-            elif question_type == "True/False":
-                question = {
-                    "createItem": {
-                        "item": {
-                            "title": question_data.question,
-                            "questionItem": {
-                                "question": {
-                                    "choiceQuestion": {
-                                        "type": "RADIO",
-                                        "options": [{"value": "True"}, {"value": "False"}]
-                                    }
-                                }
-                            }
-                        },
-                        "location": {"index": i}
-                    }
-                }
-                requests.append(question)
-
-            elif question_type == "Fill in the Blank":
-                question = {
-                    "createItem": {
-                        "item": {
-                            "title": question_data.question,
-                            "questionItem": {
-                                "question": {
-                                    "textQuestion": {}
-                                }
-                            }
-                        },
-                        "location": {"index": i}
-                    }
-                }
-                requests.append(question)
+        # Build the batchUpdate request payload in one pass.
+        item_builder = _ITEM_BUILDERS.get(question_type)
+        requests = [item_builder(q, i) for i, q in enumerate(questions.questions)] if item_builder else []
 
-        if requests:
-            body = {"requests": requests}
+        # Chunk oversized quizzes so one bad batch doesn't 413/fail the whole upload.
+        for start in range(0, len(requests), _FORMS_BATCH_LIMIT):
+            body = {"requests": requests[start:start + _FORMS_BATCH_LIMIT]}
             form_service.forms().batchUpdate(formId=form_id, body=body).execute()
 
         st.success("Google Form created successfully!")
@@ -297,68 +428,185 @@ def create_form_with_questions(creds, form_title, questions, question_type):
         st.error(f"Error creating Google Form: {e}")
         return None
 
+# --- Response Cache (exact + semantic tiers) ---
+# Repeated requests for the same (topic, num, type, instructions) tuple are common in a chat UI,
+# so cache generated questions instead of paying the LLM call again.
+_EXACT_CACHE_MAXSIZE = 256
+_SEMANTIC_SIM_THRESHOLD = 0.95
+
+# Shared worker pool for blocking LLM calls; the Streamlit script thread submits work
+# here after its status messages have been flushed. st.* calls must stay off these
+# threads — workers only run plain engine calls.
+_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+def _question_cache_key(topic, num_questions, question_type, custom_instructions):
+    """Builds a normalized cache key so trivially rephrased requests hit the cache.
+
+    num_questions arrives as a float from the Gemini dispatch (protobuf Struct
+    numbers), so it is coerced here to keep both the key and the shard math integral.
+    """
+    return (topic.strip().lower(), int(num_questions), question_type,
+            (custom_instructions or "").strip().lower())
+
+@st.cache_resource
+def _get_embedder():
+    """Loads the sentence embedding model once (None when sentence-transformers is unavailable)."""
+    try:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer("all-MiniLM-L6-v2")
+    except Exception:
+        return None
+
+def _embed_cache_key(key):
+    """Embeds the normalized key string as an int8 vector, or None when no embedder is available.
+
+    The embeddings are unit-norm, so quantizing to int8 (x127) keeps the scaled integer
+    dot product close enough to cosine similarity for cache lookups while storing each
+    vector in a quarter of the FP32 footprint.
+    """
+    embedder = _get_embedder()
+    if embedder is None:
+        return None
+    import numpy as np
+    vec = embedder.encode(" | ".join(str(part) for part in key), normalize_embeddings=True)
+    return (vec * 127.0).round().astype(np.int8)
+
+def _semantic_cache_lookup(embedding):
+    """Returns the cached questions for the closest stored key when similarity clears the threshold."""
+    if embedding is None:
+        return None
+    import numpy as np
+    query = embedding.astype(np.int32)  # promote once; int dot products stay in integer SIMD
+    for stored_embedding, value in st.session_state.setdefault("qna_semcache", deque(maxlen=128)):
+        similarity = float(stored_embedding.astype(np.int32) @ query) / (127.0 * 127.0)
+        if similarity > _SEMANTIC_SIM_THRESHOLD:
+            return value
+    return None
+
+# Questions per LLM call when sharding a large request across the worker pool.
+_SHARD_SIZE = 5
+
+def _engine_generate(engine, topic, num_questions, question_type, custom_instructions):
+    """Runs the engine on the worker pool, sharding large requests into parallel calls.
+
+    generate_questions issues its LLM calls sequentially, so a 20-question request
+    costs 4x the latency of a 5-question one. Splitting it into _SHARD_SIZE-question
+    shards fanned out on _EXECUTOR makes wall-clock time that of the slowest shard.
+    Running on the pool also lets the script thread's "Generating..." info message
+    flush to the browser before blocking. Workers only touch the engine, never st.*.
+    """
+    num_questions = int(num_questions)
+    sizes = [_SHARD_SIZE] * (num_questions // _SHARD_SIZE)
+    if num_questions % _SHARD_SIZE:
+        sizes.append(num_questions % _SHARD_SIZE)
+    if not sizes:  # degenerate count (e.g. model-supplied 0): one call, engine validates
+        sizes = [num_questions]
+    kwargs = dict(topic=topic, question_type=question_type,
+                  custom_instructions=custom_instructions or None)
+    futures = [_EXECUTOR.submit(engine.generate_questions, num=size, **kwargs)
+               for size in sizes]
+    results = [future.result() for future in futures]
+    merged = results[0]
+    for extra in results[1:]:
+        merged.questions.extend(extra.questions)
+    return merged
+
+@st.cache_data(ttl=24 * 60 * 60, max_entries=_EXACT_CACHE_MAXSIZE, show_spinner=False)
+def _exact_cached_generate(engine_key, topic, num_questions, question_type, custom_instructions, _engine):
+    """Exact-match tier: st.cache_data memo on the normalized key, shared across sessions.
+
+    The body only executes on an exact miss, so it doubles as the place where the
+    semantic tier is consulted and, failing that, the LLM is actually called. The
+    engine itself rides along in the underscore argument (excluded from the key);
+    engine_key buckets results so different models don't collide.
+    """
+    key = (topic, num_questions, question_type, custom_instructions)
+    embedding = _embed_cache_key(key)
+    cached = _semantic_cache_lookup(embedding)
+    if cached is not None:
+        return cached
+
+    st.session_state["_last_generation_cached"] = False
+
+    questions = _engine_generate(_engine, topic, num_questions, question_type, custom_instructions)
+    if embedding is not None:
+        st.session_state["qna_semcache"].append((embedding, questions))
+    return questions
+
+def _cached_generate_questions(qna_engine_instance, topic, num_questions, question_type, custom_instructions=None):
+    """Generates questions through a two-tier cache: exact key match first, then embedding similarity.
+
+    Returns (questions, cached): the hit/miss status travels with each result so
+    callers that generate several sets before displaying any (generate_mixed) get
+    per-set status rather than whatever a shared flag last held.
+    """
+    topic_key, num_key, type_key, instructions_key = _question_cache_key(
+        topic, num_questions, question_type, custom_instructions)
+    # Assume a cache hit; only the LLM path inside the memoized body flips this off.
+    st.session_state["_last_generation_cached"] = True
+    engine_key = getattr(qna_engine_instance, "_cache_key", None) or id(qna_engine_instance)
+    questions = _exact_cached_generate(
+        engine_key, topic_key, num_key, type_key, instructions_key,
+        _engine=qna_engine_instance)
+    cached = st.session_state.pop("_last_generation_cached", True)
+    return questions, cached
+
 # --- Question Generation Functions (using Educhain's qna_engine) ---
 # We still use the Educhain engine to actually generate questions, but the function *calling* is handled explicitly.
-def generate_mcq(qna_engine_instance, topic, num_questions, custom_instructions=None):
-    """Generates and displays Multiple Choice Questions."""
-    st.info(f"Generating {num_questions} Multiple Choice Questions on topic: {topic}...")  # Added info message
-    questions = qna_engine_instance.generate_questions(
-        topic=topic,
-        num=num_questions,
-        question_type="Multiple Choice",
-        custom_instructions=custom_instructions
-    )
-    return questions
 
-def generate_short_answer(qna_engine_instance, topic, num_questions, custom_instructions=None):
-    """Generates and displays Short Answer Questions."""
-    st.info(f"Generating {num_questions} Short Answer Questions on topic: {topic}...")  # Added info message
-    questions = qna_engine_instance.generate_questions(
-        topic=topic,
-        num=num_questions,
-        question_type="Short Answer",
-        custom_instructions=custom_instructions
-    )
-    return questions
+# Tool name -> (st.info label, educhain question_type). The four plain tools differ
+# only in these two strings, so a single wrapper parameterized via functools.partial
+# replaces four near-identical function bodies.
+_QTYPES = {
+    'generate_mcq': ('Multiple Choice Questions', 'Multiple Choice'),
+    'generate_short_answer': ('Short Answer Questions', 'Short Answer'),
+    'generate_true_false': ('True/False Questions', 'True/False'),
+    'generate_fill_blank': ('Fill in the Blank Questions', 'Fill in the Blank'),
+}
 
-def generate_true_false(qna_engine_instance, topic, num_questions, custom_instructions=None):
-    """Generates and displays True/False Questions."""
-    st.info(f"Generating {num_questions} True/False Questions on topic: {topic}...")  # Added info message
-    questions = qna_engine_instance.generate_questions(
-        topic=topic,
-        num=num_questions,
-        question_type="True/False",
-        custom_instructions=custom_instructions
+def _generate_typed(label, question_type, qna_engine_instance, topic, num_questions, custom_instructions=None):
+    """Generates and displays questions of a single type (shared body of the four plain tools)."""
+    st.info(f"Generating {num_questions} {label} on topic: {topic}...")  # Added info message
+    return _cached_generate_questions(
+        qna_engine_instance, topic, num_questions, question_type, custom_instructions
     )
-    return questions
 
-def generate_fill_blank(qna_engine_instance, topic, num_questions, custom_instructions=None):
-    """Generates and displays Fill in the Blank Questions."""
-    st.info(f"Generating {num_questions} Fill in the Blank Questions on topic: {topic}...")  # Added info message
-    questions = qna_engine_instance.generate_questions(
-        topic=topic,
-        num=num_questions,
-        question_type="Fill in the Blank",
-        custom_instructions=custom_instructions
-    )
-    return questions
+def generate_mixed(qna_engine_instance, topic, num_questions, question_types, custom_instructions=None):
+    """Generates several question types, returning (questions, cached) pairs keyed by type.
+
+    The cache layers (st.cache_data, session-state semantic tier) are script-thread
+    only, so the types are walked sequentially here; each miss still fans its LLM
+    calls out across the worker pool via _engine_generate, so the shards of all
+    types share the same pool rather than serializing call by call.
+    """
+    question_types = list(question_types)
+    st.info(f"Generating {num_questions} questions each of {', '.join(question_types)} on topic: {topic}...")
+    return {
+        q_type: _cached_generate_questions(
+            qna_engine_instance, topic, num_questions, q_type, custom_instructions)
+        for q_type in question_types
+    }
 
-def generate_form(qna_engine_instance, topic, num_questions, question_type, custom_instructions=None):
-    """Generates a Google Form with questions of the specified type."""
+def generate_form(qna_engine_instance, topic, num_questions, question_type, custom_instructions=None, creds=None):
+    """Generates a Google Form with questions of the specified type.
+
+    main() binds the rerun's credentials once and passes them in via the dispatch
+    table; the load_credentials fallback keeps direct calls working. URL results are
+    returned as a ("form" | "auth", url) tuple so the dispatch can caption a created
+    form and a login prompt differently.
+    """
     st.info(f"Generating a Google Form with {num_questions} {question_type} questions on topic: {topic}...")
-    creds = st.session_state.get("credentials") #To persist the creds to call less.
-    if creds and not creds.invalid: #If has creds:
-
-        questions = qna_engine_instance.generate_questions(
-            topic=topic,
-            num=num_questions,
-            question_type=question_type,
-            custom_instructions=custom_instructions
+    if creds is None:
+        creds = load_credentials() #To persist the creds to call less.
+    if creds and creds.valid: #If has creds:
+
+        questions, _ = _cached_generate_questions(
+            qna_engine_instance, topic, num_questions, question_type, custom_instructions
         )
 
         if creds: # if creds is still there. To not generate error
             form_url = create_form_with_questions(creds, FORM_TITLE, questions, question_type)  # Call form creation
-            return form_url #Returns form
+            return ("form", form_url) if form_url else None #Returns form
         else:
             st.error("Google Forms authentication failed.")#if for some reason, creds does not exits (it's an error)
             return None #Returns None
@@ -367,37 +615,155 @@ def generate_form(qna_engine_instance, topic, num_questions, question_type, cust
         auth_url = authenticate_google_api() # If no creds, generate the URL.
 
         if auth_url:#if generated url:
-            return auth_url #return the url to be show in chat.
+            return ("auth", auth_url) #return the url to be show in chat.
         else:
             st.error("Not able to generate the authentication. Please, try again.") # if no able to generate it, show and error
             return None #Return none to break
 
-def display_questions(questions):
-    """Displays questions in Streamlit."""
+@st.cache_resource(show_spinner=False)
+def _get_genai_loop():
+    """Runs one persistent event loop on a daemon thread for all async Gemini calls.
+
+    The async client caches grpc channels bound to the loop they were created on; an
+    asyncio.run per prompt would close that loop, and every later prompt would die
+    with 'Event loop is closed'. The loop therefore lives for the whole process.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="genai-loop", daemon=True).start()
+    return loop
+
+_STREAM_END = object()
+
+def _stream_on_loop(model, prompt):
+    """Bridges an async Gemini stream onto the calling (script) thread.
+
+    Chunks are produced on the persistent loop and handed over through a queue, so
+    grpc stays on its own loop while all st.* rendering stays on the script thread.
+    Exceptions from the producer are re-raised here on the consumer side.
+    """
+    chunks = queue.Queue()
+
+    async def _produce():
+        try:
+            response = await model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                chunks.put(chunk)
+        except BaseException as exc:
+            chunks.put(exc)
+        finally:
+            chunks.put(_STREAM_END)
+
+    asyncio.run_coroutine_threadsafe(_produce(), _get_genai_loop())
+    while True:
+        item = chunks.get()
+        if item is _STREAM_END:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+def _stream_markdown(text, delay=0.01):
+    """Replays already-available markdown word by word to preserve the typing effect."""
+    placeholder = st.empty()
+    shown = []
+    for word in text.split(' '):
+        shown.append(word)
+        placeholder.markdown(' '.join(shown) + ' ▌')
+        time.sleep(delay)
+    placeholder.markdown(text)
+
+# Option labels precomputed once (A..Z, then AA..ZZ) so the render loop does a tuple
+# index instead of a chr() call per option — and no longer breaks past 26 options.
+_LABELS = tuple(string.ascii_uppercase) + tuple(
+    a + b for a in string.ascii_uppercase for b in string.ascii_uppercase
+)
+
+def _render_choice_question(i, data):
+    """Renders a dumped question dict that carries options (MCQ / True-False)."""
+    lines = [f"### Question {i + 1}:", f"**Question:** {data['question']}", "Options:"]
+    lines.extend(f"- {_LABELS[j]}. {option}" for j, option in enumerate(data['options']))
+    answer = data.get('answer')
+    if answer is not None:
+        lines.append(f"**Correct Answer:** {answer}")
+    explanation = data.get('explanation')
+    if explanation:
+        lines.append(f"**Explanation:** {explanation}")
+    return "\n\n".join(lines)
+
+def _render_text_question(i, data):
+    """Renders a dumped question dict without options (short answer / fill in the blank)."""
+    lines = [f"### Question {i + 1}:", f"**Question:** {data['question']}"]
+    explanation = data.get('explanation')
+    if explanation:
+        lines.append(f"**Explanation:** {explanation}")
+    return "\n\n".join(lines)
+
+# Renderer per pydantic model class name, filled in lazily so new Educhain question
+# types fall back to a one-time hasattr probe instead of per-question attribute walks.
+_RENDERERS = {}
+
+def _renderer_for(question):
+    """Returns the renderer for a question's model class via a memoized type-name lookup."""
+    renderer = _RENDERERS.get(type(question).__name__)
+    if renderer is None:
+        renderer = _render_choice_question if hasattr(question, 'options') else _render_text_question
+        _RENDERERS[type(question).__name__] = renderer
+    return renderer
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _questions_markdown(questions):
+    """Builds the combined markdown for a question set (memoized on the set's contents).
+
+    Keyed by pickling the pydantic container, so replaying the same set — a rerun, a
+    cache-hit generation — skips the per-question model_dump/render work entirely.
+    """
+    md_parts = []
+    for i, question in enumerate(questions.questions):
+        # One Rust-accelerated model_dump per question; plain dict reads in the
+        # renderers are cheaper than repeated pydantic attribute descriptors.
+        md_parts.append(_renderer_for(question)(i, question.model_dump()))
+    return "\n\n---\n\n".join(md_parts)
+
+def display_questions(questions, cached=False):
+    """Displays questions as a single batched markdown render; returns the markdown.
+
+    Each st.write call ships its own delta over the websocket, so a per-field loop costs
+    O(N widgets) frontend work; joining everything into one st.markdown call ships one
+    delta. The caller stores the returned markdown in the chat history so reruns replay
+    the questions instead of losing them. ``cached`` is the per-set hit flag returned
+    by _cached_generate_questions.
+    """
     if questions and hasattr(questions, "questions"):
-        for i, question in enumerate(questions.questions):
-            st.subheader(f"Question {i + 1}:")
-            st.write(f"**Question:** {question.question}")
-            if hasattr(question, 'options'):
-                st.write("Options:")
-                for j, option in enumerate(question.options):
-                    st.write(f"   {chr(65 + j)}. {option}")
-                if hasattr(question, 'answer'):
-                    st.write(f"**Correct Answer:** {question.answer}")
-            if hasattr(question, 'explanation') and question.explanation:
-                st.write(f"**Explanation:** {question.explanation}")
-            st.markdown("---")
-    else:
-        st.error("No questions generated or invalid question format.")
+        rendered = _questions_markdown(questions)
+        # Cache hits arrive instantly; replay them with the typing effect so the UX
+        # matches a live streamed response instead of dumping everything at once.
+        if cached:
+            _stream_markdown(rendered)
+        else:
+            st.markdown(rendered)
+        return rendered
+    st.error("No questions generated or invalid question format.")
+    return None
+
+@st.fragment
+def _render_history():
+    """Renders the chat history as an independent fragment.
+
+    Fragment-scoped reruns (e.g. widget events inside the history) redraw only this
+    block instead of re-running the whole script, so a long conversation no longer
+    costs O(history) markdown renders per interaction elsewhere on the page.
+    """
+    for message in st.session_state.messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
 
 # --- Function Dispatcher ---
 function_map = {
-    "generate_mcq": generate_mcq,
-    "generate_short_answer": generate_short_answer,
-    "generate_true_false": generate_true_false,
-    "generate_fill_blank": generate_fill_blank,
-    "generate_form": generate_form  # New Function
+    name: functools.partial(_generate_typed, label, question_type)
+    for name, (label, question_type) in _QTYPES.items()
 }
+function_map["generate_mixed"] = generate_mixed
+function_map["generate_form"] = generate_form  # New Function
 
 def main():
     """Main function to run the Educhain Question Generator chatbot with function calling in Streamlit."""
@@ -409,7 +775,11 @@ def main():
         if not api_key:
             st.warning("Please enter your Google API Key in the sidebar.")
             st.stop()
-        genai.configure(api_key=api_key)  # Configure API Key Globally
+        # genai.configure mutates module-global state; only re-run it when the key
+        # actually changes instead of on every script rerun.
+        if st.session_state.get("_gemini_configured_key") != api_key:
+            genai.configure(api_key=api_key)  # Configure API Key Globally
+            st.session_state["_gemini_configured_key"] = api_key
 
         st.markdown("**Powered by** [Educhain](https://github.com/satvik314/educhain)")
         st.write("❤️ Built by [Build Fast with AI](https://buildfastwithai.com/genai-course)")
@@ -423,8 +793,15 @@ def main():
     }
     model_name = st.selectbox("Select Model", options=list(model_options.keys()), format_func=lambda x: model_options[x])
 
-    if "messages" not in st.session_state:
-        st.session_state["messages"] = [{"role": "assistant", "content": "How can I help you generate questions?"}]
+    # Build the heavy clients once per session, outside the prompt handler, so subsequent
+    # prompts pay no model/tool reconstruction cost (both factories are cache_resource-backed).
+    gemini_model = initialize_gemini_model(model_name)
+    qna_engine_instance = get_qna_engine(model_name, api_key)
+
+    st.session_state.setdefault("messages", [{"role": "assistant", "content": "How can I help you generate questions?"}])
+
+    # Remounted every rerun; load_credentials falls back to the persisted refresh token.
+    st.session_state["_cookies"] = _get_cookie_manager()
 
     # Get the authentication code from the URL parameters, if it exists
     query_params = st.query_params  # Use st.query_params
@@ -440,10 +817,16 @@ def main():
                 st.error("Authentication failed after redirect.") #Added.
                 st.stop() #Added
 
-    creds = st.session_state.get("credentials") #Added # get all of the credentials after that
+    creds = load_credentials() #Added # get all of the credentials after that
 
     if not creds: #Added #if no has credentials:
-        auth_url = authenticate_google_api() #Added. calls the authentication to get an URL
+        # Reruns fire on every widget event; generate the auth URL once per session
+        # and replay it from session state instead of re-entering the OAuth flow.
+        auth_url = st.session_state.get("auth_url")
+        if auth_url is None:
+            auth_url = authenticate_google_api() #Added. calls the authentication to get an URL
+            if auth_url:
+                st.session_state["auth_url"] = auth_url
 
         if auth_url: #Added # if the call is true and generates an URL, show on screen the URL to connect
 
@@ -454,74 +837,115 @@ def main():
         else: #added. If does not create the URL show the error,
             st.error("Not able to generate the authentication. Please, try again.") #Added.
 
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    # Bind this rerun's credentials into the dispatch once, so generate_form does
+    # not re-derive them from session state mid-call.
+    dispatch_map = dict(function_map)
+    dispatch_map["generate_form"] = functools.partial(generate_form, creds=creds)
+
+    _render_history()
 
     if prompt := st.chat_input("Type your question here..."):
         st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        gemini_model = initialize_gemini_model(model_name, tools_config)  # Initialize Gemini Model with function calling
-
-        educhain_client = Educhain(LLMConfig(custom_model=ChatGoogleGenerativeAI(model=model_name, google_api_key=api_key)))  # Initialize Educhain
-        qna_engine_instance = educhain_client.qna_engine
-
         with st.chat_message("assistant"):
-            message_placeholder = st.empty()
+            # Created lazily on the first text chunk: tool-use prompts (the common case
+            # here) never stream text, so they should not allocate or rerender a
+            # placeholder widget at all.
+            message_placeholder = None
             full_response = ""
-            function_called = False  # Flag to track if a function was called
 
             try:
-                response = gemini_model.generate_content(prompt, stream=True)  # Stream response
-                for chunk in response:
-                    if hasattr(chunk.parts[0], 'function_call'):  # Function call detected in chunk
-                        function_call = chunk.parts[0].function_call
-                        function_name = function_call.name
-                        arguments = function_call.args
-                        #full_response = f"Function Call: {function_name} with args: {arguments}"  # Simple text for UI  #Removed funtion called
-
-                        #message_placeholder.markdown(full_response + "▌")  # Show function call info #Removed funtion called
-                        function_called = True  # Set flag
-
-                        if function_name in function_map:
-                            question_generation_function = function_map[function_name]
-                            function_result = question_generation_function(qna_engine_instance, **arguments) #Added
-
-                            if function_result: #Added. If not authenticated it shows a URL. If authenticated it will show form URL
-                                if "http" in function_result: #Added. Authentication or form url. If auth then:
-                                    st.markdown("")
-
-                                else:
-                                    st.markdown(f"Form URL: [Click here]({function_result})")#Added #if for is created it show this.
-
+                def _consume_stream():
+                    """Consumes the Gemini stream, returning a function call (if any) and the text so far.
+
+                    The first chunk is inspected on its own: tool-use responses carry the
+                    function call there, so that path returns before any placeholder or
+                    text accumulation happens. Only genuine text responses enter the loop.
+                    """
+                    nonlocal message_placeholder
+                    stream = _stream_on_loop(gemini_model, prompt)  # Stream response
+                    first = next(stream, None)
+                    if first is None:
+                        return None, ""
+
+                    part = first.candidates[0].content.parts[0]
+                    fc = getattr(part, 'function_call', None)
+                    if fc and fc.name:  # Function call detected in first chunk
+                        return fc, ""
+
+                    message_placeholder = st.empty()
+                    collected = [first.text or ""]
+                    last_render = 0.0
+                    for chunk in stream:
+                        part = chunk.candidates[0].content.parts[0]
+                        fc = getattr(part, 'function_call', None)
+                        if fc and fc.name:  # Late function call after some text (rare)
+                            return fc, "".join(collected)
+                        collected.append(chunk.text or "")
+                        # Rate-limit the typing effect to ~10 Hz; per-token rerenders just
+                        # flood the websocket without improving perceived latency.
+                        now = time.monotonic()
+                        if now - last_render > 0.1:
+                            message_placeholder.markdown("".join(collected) + "▌")
+                            last_render = now
+                    return None, "".join(collected)
+
+                function_call, full_response = _consume_stream()
+
+                if function_call is not None:
+                    function_name = function_call.name
+                    arguments = function_call.args
+
+                    question_generation_function = dispatch_map.get(function_name)
+                    if question_generation_function is not None:
+                        function_result = question_generation_function(qna_engine_instance, **arguments) #Added
+
+                        if not function_result:
+                            st.error("Error occured. Not able to create question/authenticate") # Added if is not able to create questions/authenticate
+                            st.stop()#added
+
+                        # One UI update per dispatch outcome, and the resulting markdown
+                        # is stored as the assistant message so reruns replay the actual
+                        # questions from history instead of a stub.
+                        if isinstance(function_result, tuple) and function_result[0] in ("form", "auth"):  # URL from generate_form
+                            kind, url = function_result
+                            if kind == "auth":
+                                full_response = f"Please authenticate with Google: [Login to Google]({url})"
                             else:
-                                st.error("Error occured. Not able to create question/authenticate") # Added if is not able to create questions/authenticate
-                                st.stop()#added
-
-                            function_called = True  # Redundant, but for clarity
-                        else:
-                            st.error(f"Error: Unknown function name '{function_name}' received from model.")
-                            full_response = "Error processing function call."
-                            message_placeholder.markdown(full_response)
-                            function_called = True  # To prevent default text response handling
-                        break  # Exit chunk streaming loop as function call is handled
-
-                    else:  # Regular text response chunk
-                        if not function_called:  # Only append if not already handled a function call
-                            full_response += (chunk.text or "")
-                            message_placeholder.markdown(full_response + "▌")  # Typing effect
-
-                if not function_called:  # Finalize message if it was a text response (not function call)
+                                full_response = f"Form URL: [Click here]({url})"
+                            st.markdown(full_response)
+                        elif isinstance(function_result, dict):  # mixed generation: type -> (questions, cached)
+                            parts = []
+                            for qtype, (questions, cached) in function_result.items():
+                                st.markdown(f"**{qtype}**")
+                                rendered = display_questions(questions, cached)
+                                if rendered:
+                                    parts.append(f"**{qtype}**\n\n{rendered}")
+                            full_response = "\n\n".join(parts) or "No questions generated."
+                        else:  # (questions, cached) from the plain question tools
+                            questions, cached = function_result
+                            full_response = display_questions(questions, cached) or "No questions generated."
+
+                    else:
+                        st.error(f"Error: Unknown function name '{function_name}' received from model.")
+                        full_response = "Error processing function call."
+
+                elif message_placeholder is not None:  # Finalize message if it was a text response (not function call)
                     message_placeholder.markdown(full_response)
 
             except Exception as e:
                 st.error(f"An error occurred: {e}")
                 full_response = "Error generating response."
-                message_placeholder.markdown(full_response)
+                if message_placeholder is not None:
+                    message_placeholder.markdown(full_response)
 
-            st.session_state.messages.append({"role": "assistant", "content": full_response if not function_called else "Function call processed. See questions below."})  # Store a simple message for function calls
+            st.session_state.messages.append({"role": "assistant", "content": full_response})  # full_response already carries the dispatch outcome text
+            # Cap history: session state outlives the tab and the whole list is walked
+            # each rerun, so an unbounded log grows both memory and render time.
+            if len(st.session_state.messages) > MAX_HISTORY:
+                st.session_state.messages = st.session_state.messages[-MAX_HISTORY:]
 
 if __name__ == "__main__":
     main()